@@ -1,12 +1,98 @@
 import streamlit as st
 import json
+import orjson
 import os
+import hashlib
+import asyncio
+import time
 import re
 import shutil
+import mmap
+import functools
 from eppy.modeleditor import IDF
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import zipfile
 import io
+import numpy as np
+
+# IDF 文本解析用的预编译正则
+# 对象块：行首类型名 + 逗号，直到注释之外的第一个分号（含分号所在行的尾注释）
+_OBJ_BLOCK_RE = re.compile(
+    r"^[ \t]*([^\s,;!][^,;!\n]*?)[ \t]*(?:;|,(?:[^;!]|![^\n]*(?=\n|\Z))*;)[^\n]*",
+    re.MULTILINE
+)
+# 字段行：(缩进)(数值)(分隔符及其后空白)(!- 标记)(字段名注释)
+_FIELD_LINE_RE = re.compile(
+    r"^([ \t]*)([^,;!\n]*?)([ \t]*[,;][^!\n]*)(![- \t]*)([^\n]*)$",
+    re.MULTILINE
+)
+
+# LLM 调用配置
+LLM_MODEL = "gpt-4o"
+EMBEDDING_MODEL = "text-embedding-3-small"
+LLM_CACHE_TTL = 3600             # 缓存有效期（秒）
+SEMANTIC_CACHE_THRESHOLD = 0.92  # 语义缓存命中所需的余弦相似度
+
+def _sha256(*parts):
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+def _normalize(vec):
+    vec = np.asarray(vec, dtype=np.float64)
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else None
+
+def _chat_kwargs(system_prompt, user_request):
+    user_prompt = f'用户需求: "{user_request}"'
+    return dict(
+        model=LLM_MODEL, temperature=0,
+        messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+        response_format={"type": "json_object"}
+    )
+
+# 去掉下划线与空格的转换表：一次 translate 代替多次 replace
+_NORM_TBL = str.maketrans('', '', '_ ')
+
+@functools.lru_cache(maxsize=4096)
+def _norm(name):
+    """UI/LLM 给出的字段名与 eppy 属性名的比较形式：小写并去掉下划线与空格"""
+    return name.lower().translate(_NORM_TBL)
+
+_NON_ALNUM_RE = re.compile(r"[^0-9A-Za-z]+")
+
+@functools.lru_cache(maxsize=4096)
+def _field_key(name):
+    """
+    字段名规范化，使 eppy 属性名与 IDF 注释中的字段名可以直接比较：
+    去掉单位注释 {W/m2}，只保留字母数字并转大写（与 eppy 生成属性名时丢弃的字符一致）。
+    同一注释在成千上万个对象中反复出现，因此缓存结果
+    """
+    return _NON_ALNUM_RE.sub("", name.partition("{")[0]).upper()
+
+def _terminated_end(text):
+    """返回最后一个（注释之外的）分号所在行的行尾位置；没有分号时返回 0"""
+    line_end = len(text)
+    while line_end > 0:
+        line_start = text.rfind("\n", 0, line_end) + 1
+        if ";" in text[line_start:line_end].partition("!")[0]:
+            return line_end
+        line_end = line_start - 1
+    return 0
+
+def _decode_idf_text(raw):
+    """按 utf-8 → latin-1 的顺序解码 IDF 内容（bytes、memoryview 或 mmap 等缓冲区），并统一换行符（与文本模式读取一致）"""
+    try:
+        text = str(raw, 'utf-8')
+    except UnicodeDecodeError:
+        text = str(raw, 'latin-1')
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+def _load_idf(idd_path, idf_path):
+    """设置 IDD 并解析 IDF（大模型可能耗时数秒）"""
+    try:
+        IDF.setiddname(idd_path)
+        return IDF(idf_path)
+    except Exception as e:
+        raise RuntimeError(f"加载 IDF/IDD 失败: {e}")
 
 # ==========================================
 # 后端逻辑类 (经过 UI 适配改造)
@@ -16,38 +102,59 @@ class EnergyPlusAutomationUI:
     针对 UI 优化的自动化类。
     移除了 print 和 input，改为返回数据供 UI 渲染。
     """
-    def __init__(self, idf_path, idd_path, api_key):
+    def __init__(self, idf_path, idd_path, api_key, idf_text=None, base_idf=None):
         self.idf_path = idf_path
         self.idd_path = idd_path
+        # IDF 原始文本：UI 上传时已在内存中，直接传入可免去生成算例时再读一次文件
+        self.idf_text = idf_text
+        # 实际加载的 IDD/IDF 内容哈希（由 UI 在初始化时记录），用作渲染缓存的键
+        self.idd_hash = None
+        self.idf_hash = None
         
         # 验证文件
         if not os.path.exists(idf_path): raise FileNotFoundError(f"IDF file not found: {idf_path}")
         if not os.path.exists(idd_path): raise FileNotFoundError(f"IDD file not found: {idd_path}")
         
-        # 设置 IDD 并加载 IDF
-        try:
-            IDF.setiddname(idd_path)
-            self.base_idf = IDF(idf_path)
-        except Exception as e:
-            raise RuntimeError(f"加载 IDF/IDD 失败: {e}")
+        # 设置 IDD 并加载 IDF（可直接传入已解析好的 IDF 对象）
+        self.base_idf = base_idf if base_idf is not None else _load_idf(idd_path, idf_path)
 
-        # 加载 API Key
+        # 加载 API Key（异步客户端在并发请求时按需创建）
+        self.api_key = api_key
         self.client = OpenAI(api_key=api_key) if api_key else None
 
+        # 对象概览缓存（IDF 加载后不再变化，避免每次 rerun 重新遍历全部对象）
+        self._summary_cache = None
+        self._names_cache = {}
+        # 按对象类型缓存的字段名元组与 {规范化字段名: 实际属性名} 映射
+        self._fieldnames_cache = {}
+        self._norm_map_cache = {}
+        # IDF 原始文本及其对象块索引（首次生成算例时构建）
+        self._block_index = None
+
     def get_idf_object_summary(self):
+        if self._summary_cache is not None:
+            return self._summary_cache
         summary = {}
         for obj_type in self.base_idf.idfobjects:
             objs = self.base_idf.idfobjects[obj_type]
             if len(objs) > 0:
-                summary[obj_type] = {
-                    "count": len(objs),
-                    "all_names": [getattr(o, 'Name', 'N/A') for o in objs]
-                }
+                # 只记录数量；Names 通过 get_names 按需构建
+                summary[obj_type] = {"count": len(objs)}
+        self._summary_cache = summary
         return summary
 
+    def get_names(self, obj_type):
+        """某对象类型全部对象的 Name，首次访问时构建并缓存"""
+        if obj_type not in self._names_cache:
+            self._names_cache[obj_type] = [getattr(o, 'Name', 'N/A') for o in self.base_idf.idfobjects[obj_type]]
+        return self._names_cache[obj_type]
+
     def generate_object_plan(self, user_request):
         if not self.client: return None
-        object_summary = self.get_idf_object_summary()
+        object_summary = {
+            obj_type: {"count": info["count"], "all_names": self.get_names(obj_type)}
+            for obj_type, info in self.get_idf_object_summary().items()
+        }
         
         system_prompt = """
         你是 EnergyPlus 对象选择助手。只输出严格 JSON。
@@ -60,26 +167,36 @@ class EnergyPlusAutomationUI:
           "modifications": []
         }
         """
-        user_prompt = f"""
-        用户需求: "{user_request}"
+        # 对象概览放入 system 作为固定前缀（orjson 稳定序列化，比 json.dumps 快数倍），同一会话内的请求前缀逐字一致，可命中 OpenAI prompt caching
+        system_prompt += f"""
         对象概览：
-        {json.dumps(object_summary, indent=2, ensure_ascii=False)}
+        {orjson.dumps(object_summary, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode()}
         """
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o", temperature=0,
-                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-                response_format={"type": "json_object"}
-            )
-            return json.loads(response.choices[0].message.content)
+            return self._chat_json(system_prompt, user_request)
         except Exception as e:
             st.error(f"LLM 调用失败: {e}")
             return None
 
     def generate_field_plan(self, user_request, object_type):
-        if not self.client: return None
+        return self.generate_field_plans(user_request, [object_type]).get(object_type)
+
+    def generate_field_plans(self, user_request, object_types):
+        """并发请求多个对象类型的字段方案，返回 {object_type: plan}（失败的类型为 None）"""
+        if not self.client: return {ot: None for ot in object_types}
+
+        async def fanout():
+            # 异步客户端绑定在本次事件循环内，用完即关闭
+            async with AsyncOpenAI(api_key=self.api_key) as aclient:
+                return await asyncio.gather(
+                    *[self._field_plan_async(aclient, user_request, ot) for ot in object_types]
+                )
+
+        return dict(zip(object_types, asyncio.run(fanout())))
+
+    async def _field_plan_async(self, aclient, user_request, object_type):
         if object_type not in self.base_idf.idfobjects: return None
-        fields = self.base_idf.idfobjects[object_type][0].fieldnames
+        fields = self._fieldnames(object_type)
 
         system_prompt = """
         你是 EnergyPlus 字段选择助手。只输出严格 JSON。
@@ -90,26 +207,112 @@ class EnergyPlusAutomationUI:
           "modifications": []
         }
         """
-        user_prompt = f"""
-        用户需求: "{user_request}"
+        # 对象类型与字段列表同样放入 system，user 消息只保留需求本身
+        system_prompt += f"""
         对象类型：{object_type}
-        字段列表：{json.dumps(fields, ensure_ascii=False)}
+        字段列表：{orjson.dumps(fields).decode()}
         """
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o", temperature=0,
-                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-                response_format={"type": "json_object"}
-            )
-            return json.loads(response.choices[0].message.content)
+            return await self._chat_json_async(aclient, system_prompt, user_request)
         except Exception:
             return None
 
+    # ---------- LLM 调用与缓存 ----------
+    # 缓存策略（temperature=0，相同输入的结果可直接复用）：
+    # 1. 精确缓存：sha256(模型 + system + 需求) 命中即返回
+    # 2. 语义缓存：system（含对象概览/字段列表）相同时，需求文本 embedding 的余弦相似度超过阈值即复用
+    # 缓存存放在 st.session_state.llm_cache，条目 1 小时后过期
+
+    def _chat_json(self, system_prompt, user_request):
+        exact_key, scope_key = _sha256(LLM_MODEL, system_prompt, user_request), _sha256(LLM_MODEL, system_prompt)
+        content = self._cache_get(exact_key)
+        if content is None:
+            embedding = self._embed(user_request)
+            content = self._cache_get(exact_key, scope_key, embedding)
+            if content is None:
+                response = self.client.chat.completions.create(**_chat_kwargs(system_prompt, user_request))
+                content = response.choices[0].message.content
+                self._cache_put(exact_key, scope_key, embedding, content)
+        return json.loads(content)
+
+    async def _chat_json_async(self, aclient, system_prompt, user_request):
+        exact_key, scope_key = _sha256(LLM_MODEL, system_prompt, user_request), _sha256(LLM_MODEL, system_prompt)
+        content = self._cache_get(exact_key)
+        if content is None:
+            embedding = await self._embed_async(aclient, user_request)
+            content = self._cache_get(exact_key, scope_key, embedding)
+            if content is None:
+                response = await aclient.chat.completions.create(**_chat_kwargs(system_prompt, user_request))
+                content = response.choices[0].message.content
+                self._cache_put(exact_key, scope_key, embedding, content)
+        return json.loads(content)
+
+    def _embed(self, text):
+        """返回归一化后的 embedding；失败时返回 None，仅跳过语义缓存层"""
+        try:
+            response = self.client.embeddings.create(model=EMBEDDING_MODEL, input=text)
+        except Exception:
+            return None
+        return _normalize(response.data[0].embedding)
+
+    async def _embed_async(self, aclient, text):
+        try:
+            response = await aclient.embeddings.create(model=EMBEDDING_MODEL, input=text)
+        except Exception:
+            return None
+        return _normalize(response.data[0].embedding)
+
+    def _llm_cache(self):
+        if 'llm_cache' not in st.session_state:
+            st.session_state.llm_cache = {"exact": {}, "semantic": {}}
+        return st.session_state.llm_cache
+
+    def _cache_get(self, exact_key, scope_key=None, embedding=None):
+        """查询缓存：只给 exact_key 时查精确层，同时给出 scope_key 与 embedding 时再查语义层"""
+        cache = self._llm_cache()
+        now = time.time()
+
+        hit = cache["exact"].get(exact_key)
+        if hit:
+            if now - hit[0] < LLM_CACHE_TTL:
+                return hit[1]
+            del cache["exact"][exact_key] # 过期条目直接删除
+
+        if scope_key is None or embedding is None:
+            return None
+        entries = [e for e in cache["semantic"].get(scope_key, []) if now - e[0] < LLM_CACHE_TTL]
+        cache["semantic"][scope_key] = entries
+        if entries:
+            similarities = np.vstack([e[1] for e in entries]) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] > SEMANTIC_CACHE_THRESHOLD:
+                # 同时写入精确层（沿用原条目时间戳），相同请求再次出现时无需再调用 embedding
+                cache["exact"][exact_key] = (entries[best][0], entries[best][2])
+                return entries[best][2]
+        return None
+
+    def _cache_put(self, exact_key, scope_key, embedding, content):
+        json.loads(content) # 只缓存合法 JSON
+        cache = self._llm_cache()
+        now = time.time()
+        # 写入前清理两层中的过期条目，避免不再被查询的键一直占用会话内存
+        for key in [k for k, v in cache["exact"].items() if now - v[0] >= LLM_CACHE_TTL]:
+            del cache["exact"][key]
+        for key in list(cache["semantic"]):
+            entries = [e for e in cache["semantic"][key] if now - e[0] < LLM_CACHE_TTL]
+            if entries:
+                cache["semantic"][key] = entries
+            else:
+                del cache["semantic"][key]
+        cache["exact"][exact_key] = (now, content)
+        if embedding is not None:
+            cache["semantic"].setdefault(scope_key, []).append((now, embedding, content))
+
     def get_all_fields(self, object_type):
         """辅助方法：获取某对象的全部字段"""
         if object_type in self.base_idf.idfobjects and len(self.base_idf.idfobjects[object_type]) > 0:
             obj = self.base_idf.idfobjects[object_type][0]
-            return self._get_active_fields(obj)
+            return self._get_active_fields(obj, self._fieldnames(object_type))
         return []
 
     def get_object_sample(self, object_type):
@@ -117,32 +320,54 @@ class EnergyPlusAutomationUI:
         if object_type in self.base_idf.idfobjects and len(self.base_idf.idfobjects[object_type]) > 0:
             obj = self.base_idf.idfobjects[object_type][0]
             data = {}
-            for f in self._get_active_fields(obj):
+            for f in self._get_active_fields(obj, self._fieldnames(object_type)):
                 data[f] = getattr(obj, f, "")
             return data
         return {}
 
-    def _get_active_fields(self, obj):
+    def _fieldnames(self, obj_type):
+        """某对象类型的字段名（同类型对象一致），首次访问后缓存为元组，避免反复经过 eppy 的属性机制"""
+        if obj_type not in self._fieldnames_cache:
+            self._fieldnames_cache[obj_type] = tuple(self.base_idf.idfobjects[obj_type][0].fieldnames)
+        return self._fieldnames_cache[obj_type]
+
+    def _field_norm_map(self, obj_type):
+        """某对象类型的 {规范化字段名: 实际属性名}，同样按类型缓存"""
+        if obj_type not in self._norm_map_cache:
+            norm_map = {}
+            for attr in self._fieldnames(obj_type):
+                norm_map.setdefault(_norm(attr), attr)
+            self._norm_map_cache[obj_type] = norm_map
+        return self._norm_map_cache[obj_type]
+
+    def _get_active_fields(self, obj, fieldnames=None):
         """返回 IDF 中实际存在的字段：
         - 移除 eppy 自动添加的 key 字段
         - 保留值为 0 的字段
         - 去掉尾部连续的空/None 字段，只展示 IDF 中实际写入的部分
+        fieldnames 可传入已缓存的字段名，缺省时读取 obj.fieldnames
         """
-        # 找到最后一个非空值的索引（空字符串或 None 视为空，0 保留）
+        # 从后往前找到最后一个非空值的索引（空字符串或 None 视为空，0 保留），
+        # 只需扫描尾部的空字段即可提前结束
+        fieldvalues = obj.fieldvalues
         last_idx = -1
-        for idx, val in enumerate(obj.fieldvalues):
+        for idx in range(len(fieldvalues) - 1, -1, -1):
+            val = fieldvalues[idx]
             if val is None:
                 continue
             if isinstance(val, str) and val.strip() == "":
                 continue
             last_idx = idx
+            break
 
         # 如果全空，只返回空列表
         if last_idx < 0:
             return []
 
+        if fieldnames is None:
+            fieldnames = obj.fieldnames
         active_fields = []
-        for idx, f in enumerate(obj.fieldnames):
+        for idx, f in enumerate(fieldnames):
             if f.lower() == "key":
                 continue
             if idx > last_idx:
@@ -150,130 +375,147 @@ class EnergyPlusAutomationUI:
             active_fields.append(f)
         return active_fields
 
-    def execute_modification(self, modifications, output_path, coefficients):
+    def _collect_targets(self, modifications):
         """
-        执行修改。modifications 是 UI 传递过来的结构：
-        [{'object_type': '...', 'fields': ['field1', 'field2'], 'coef': 0.8}, ...]
-        注意：这里为了简化，逻辑稍微调整为直接根据系数计算
+        收集所有待修改的数值字段（与系数无关，只需遍历一次）。
+        modifications 结构：[{'object_type': '...', 'fields': ['field1', 'field2']}, ...]
+        返回 (types, names, fields, old_vals)，其中 old_vals 为 float 数组
         """
-        # 构建符合原始逻辑的 plan 结构
-        target_updates = []
-        
-        # 为了支持文本替换，我们需要预先计算值
+        types, names, attrs, old_vals = [], [], [], []
+
         for mod in modifications:
             obj_type = mod['object_type']
             fields = mod['fields']
-            coef = mod['coef'] # 每个对象组可能有不同的系数，或者全局系数
             
             if obj_type not in self.base_idf.idfobjects: continue
-
-            for obj in self.base_idf.idfobjects[obj_type]:
+            objs = self.base_idf.idfobjects[obj_type]
+            if len(objs) == 0: continue
+
+            # 同类型对象字段名一致：{规范化字段名: 实际属性名} 按类型缓存
+            norm_map = self._field_norm_map(obj_type)
+            # 查找字段实际名称（处理大小写/空格），同样只算一次
+            target_attrs = []
+            for field in fields:
+                norm_field = _norm(field.strip())
+                if norm_field in norm_map:
+                    target_attrs.append(norm_map[norm_field])
+
+            for obj in objs:
                 obj_name = getattr(obj, 'Name', 'N/A')
                 
-                for field in fields:
-                    # 查找字段实际名称（处理大小写/空格）
-                    clean_field = field.strip()
-                    valid_attrs = obj.fieldnames
-                    target_attr = None
-                    
-                    # 匹配逻辑
-                    norm_field = clean_field.lower().replace("_", "").replace(" ", "")
-                    for attr in valid_attrs:
-                        if attr.lower().replace("_", "").replace(" ", "") == norm_field:
-                            target_attr = attr
-                            break
-                    
-                    if target_attr:
-                        old_val = getattr(obj, target_attr, 0)
-                        try:
-                            # 尝试转数字
-                            val_num = float(old_val) if old_val != '' else 0.0
-                            new_val = round(val_num * coef, 6)
-                            
-                            target_updates.append({
-                                "type": obj_type,
-                                "name": obj_name,
-                                "field": target_attr,
-                                "value": new_val
-                            })
-                        except ValueError:
-                            pass # 非数字字段跳过
-
-        # 文本替换保存逻辑 (复用原始逻辑的核心部分)
-        self._save_with_text_replacement(target_updates, output_path)
-        return len(target_updates)
-
-    def _save_with_text_replacement(self, target_updates, output_path):
-        # 读取原始文本
-        try:
-            with open(self.idf_path, 'r', encoding='utf-8') as f: lines = f.readlines()
-        except:
-            with open(self.idf_path, 'r', encoding='latin-1') as f: lines = f.readlines()
-
-        # 建立快速查找表
-        updates_map = {} 
-        for item in target_updates:
-            t, n, f = item['type'].upper(), item['name'].upper(), item['field'].upper()
-            if t not in updates_map: updates_map[t] = {}
-            if n not in updates_map[t]: updates_map[t][n] = {}
-            updates_map[t][n][f] = item['value']
-
-        new_lines = []
-        current_type = None
-        current_name = None
-        in_obj = False
-
-        for line in lines:
-            stripped = line.strip()
-            # 简单的状态机解析
-            if not in_obj and stripped and not stripped.startswith('!'):
-                parts = stripped.split('!')[0].split(',')
-                possible_type = parts[0].replace(';', '').strip().upper()
-                if possible_type in updates_map:
-                    current_type = possible_type
-                    in_obj = True
-                    current_name = "N/A"
-                elif ',' in stripped or ';' in stripped:
-                    in_obj = True
-                    current_type = "UNKNOWN"
-
-            if in_obj:
-                if ';' in line.split('!')[0]: in_obj = False
-                if "!- Name" in line:
-                    val = line.split('!')[0].replace(',','').replace(';','').strip().upper()
-                    current_name = val
-                
-                # 尝试替换
-                if current_type in updates_map and '!' in line:
-                    comment = line.split('!')[1].strip()
-                    field_key = comment[2:].strip().upper() if comment.startswith('- ') else comment.upper()
-                    
-                    # 查找匹配
-                    target_fields = updates_map[current_type].get(current_name, {})
-                    matched_val = None
-                    for tk, tv in target_fields.items():
-                        if tk.replace(" ","").replace("_","") in field_key.replace(" ","").replace("_",""):
-                            matched_val = tv
-                            break
-                    
-                    if matched_val is not None:
-                        # 正则替换数值保留格式
-                        idx_bang = line.find('!')
-                        content = line[:idx_bang]
-                        comment_part = line[idx_bang:]
-                        m = re.match(r"^(\s*)([-+]?\d*\.?\d+(?:[Ee][-+]?\d+)?)(\s*)([,;].*)$", content.rstrip('\r\n'))
-                        if m:
-                            line = f"{m.group(1)}{matched_val}{m.group(3)}{m.group(4)}{comment_part}"
-                        else:
-                            # 简单逗号分隔回退
-                            parts = content.split(',', 1)
-                            if len(parts) == 2:
-                                line = f"    {matched_val},{parts[1]}{comment_part}"
-            
-            new_lines.append(line)
+                for target_attr in target_attrs:
+                    old_val = getattr(obj, target_attr, 0)
+                    try:
+                        # 尝试转数字
+                        val_num = float(old_val) if old_val != '' else 0.0
+                    except ValueError:
+                        continue # 非数字字段跳过
+                    types.append(obj_type)
+                    names.append(obj_name)
+                    attrs.append(target_attr)
+                    old_vals.append(val_num)
+
+        return types, names, attrs, np.asarray(old_vals, dtype=np.float64)
+
+    def execute_modification(self, modifications, output_path, coef, plan=None):
+        """
+        执行修改。modifications 是 UI 传递过来的结构：
+        [{'object_type': '...', 'fields': ['field1', 'field2']}, ...]
+        批量生成多个系数时，可先调用 _prepare_replacement_plan 并通过 plan 传入，
+        这样文本只解析一次，每个系数只做数值替换
+        """
+        if plan is None:
+            plan = self._prepare_replacement_plan(self._collect_targets(modifications))
+        return _write_case(plan, coef, output_path)
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.writelines(new_lines)
+    def _prepare_replacement_plan(self, targets):
+        """
+        定位所有待替换数值在 IDF 文本中的位置（与系数无关）。
+        返回 (text, sites, unique_vals, value_idx)：
+        - sites 按偏移升序：[(offset, length, old_val, obj_type, name, field), ...]
+        - unique_vals 为去重后的原值数组，value_idx[i] 为 sites[i] 的原值在其中的下标
+        """
+        text, block_index = self._get_block_index()
+
+        # 建立快速查找表：(TYPE, NAME, 规范化字段名) -> 原值，一次哈希查找即可命中
+        updates_map = {}
+        for t, n, f, v in zip(*targets[:3], targets[3].tolist()):
+            updates_map[(t.upper(), n.upper(), _field_key(f))] = v
+        target_types = {key[0] for key in updates_map}
+
+        sites = []
+        # 只遍历目标类型的对象块，其余对象完全不进入字段匹配
+        target_blocks = [
+            (start, end, current_type)
+            for current_type in target_types
+            for start, end in block_index.get(current_type, [])
+        ]
+        for start, end, current_type in target_blocks:
+            current_name = "N/A"
+
+            for m in _FIELD_LINE_RE.finditer(text, start, end):
+                field_key = _field_key(m.group(5))
+                if field_key == "NAME":
+                    current_name = m.group(2).strip().upper()
+                    continue
+
+                # 查找匹配
+                old_val = updates_map.get((current_type, current_name, field_key))
+                if old_val is not None:
+                    # 只记录数值部分的位置（取 span，不再截取数值子串），缩进、分隔符与注释格式保持不变
+                    value_start, value_end = m.span(2)
+                    sites.append((value_start, value_end - value_start, old_val, current_type, current_name, field_key))
+
+        sites.sort()
+        # 相同原值（如大量同功率密度的灯具）只需按系数计算并格式化一次：
+        # 预先去重，记录每个位置对应的原值下标
+        old_vals = np.fromiter((site[2] for site in sites), dtype=np.float64, count=len(sites))
+        unique_vals, value_idx = np.unique(old_vals, return_inverse=True)
+        return text, sites, unique_vals, value_idx.tolist()
+
+    def _get_block_index(self):
+        """
+        读取 IDF 文本并建立对象块索引 {TYPE: [(start, end), ...]}。
+        文本与索引只构建一次，之后每次生成都直接复用
+        """
+        if self._block_index is None:
+            text = self.idf_text
+            if text is None:
+                # 通过 mmap 直接从页缓存解码，不再额外复制一份完整的 bytes
+                with open(self.idf_path, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        text = ""
+                    else:
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                            text = _decode_idf_text(mm)
+
+            block_index = {}
+            # 只在最后一个分号之前匹配：末尾缺少分号的残缺对象（截断/格式错误的文件）
+            # 会让每个行首都扫描到文件末尾，导致耗时随残缺行数平方增长
+            for block in _OBJ_BLOCK_RE.finditer(text, 0, _terminated_end(text)):
+                block_index.setdefault(block.group(1).upper(), []).append((block.start(), block.end()))
+            self._block_index = (text, block_index)
+        return self._block_index
+
+# ==========================================
+# 批量生成辅助函数
+# ==========================================
+
+def _write_case(plan, coef, output_path):
+    """按替换计划写出单个系数对应的 IDF，返回修改的数值个数"""
+    text, sites, unique_vals, value_idx = plan
+    # 每个不同的原值只计算、格式化一次，替换位置直接按下标取用已格式化的字符串
+    new_strs = [str(v) for v in np.round(unique_vals * coef, 6).tolist()]
+
+    # 原文片段与新数值依次流式写出，不在内存中拼接完整的输出文本
+    with open(output_path, 'w', encoding='utf-8') as f:
+        prev = 0
+        for (offset, length, *_), vi in zip(sites, value_idx):
+            f.write(text[prev:offset])
+            f.write(new_strs[vi])
+            prev = offset + length
+        f.write(text[prev:])
+    return len(sites)
 
 # ==========================================
 # Streamlit 前端界面
@@ -288,6 +530,30 @@ if 'object_plan' not in st.session_state: st.session_state.object_plan = None
 if 'selected_objects' not in st.session_state: st.session_state.selected_objects = [] # List of strings
 if 'field_config' not in st.session_state: st.session_state.field_config = {} # {obj_type: [fields]}
 
+# --- 缓存的数据与资源 ---
+@st.cache_resource(show_spinner=False, max_entries=2, ttl=3600)
+def _load_idf_cached(idd_path, idf_path, idd_hash, idf_hash):
+    """
+    按文件内容哈希缓存解析好的 IDF 对象：重置或重新初始化同一文件时无需再次解析（IDF 只读使用）。
+    解析后的模型占用内存较大，最多保留 2 个，且 1 小时后过期
+    """
+    return _load_idf(idd_path, idf_path)
+
+@st.cache_data(show_spinner=False)
+def _build_sorted_summary(idf_hash, idd_hash, _auto):
+    """
+    Step 2 分类详情所需数据：[(obj_type, count), ...]，按数量排序。
+    以 _auto 实际加载文件的哈希为缓存键（_auto 以下划线开头，不参与哈希），同一文件的 rerun 直接复用
+    """
+    summary = _auto.get_idf_object_summary()
+    return sorted(((obj_type, info['count']) for obj_type, info in summary.items()), key=lambda x: x[1], reverse=True)
+
+@st.cache_data(show_spinner=False)
+def _build_name_columns(idf_hash, idd_hash, obj_type, _auto):
+    """某对象类型的 Names 按三列拼好的文本，仅在用户要求显示时构建"""
+    names_list = _auto.get_names(obj_type)
+    return ["\n\n".join(f"  • {name}" for name in names_list[i::3]) for i in range(3)]
+
 # --- 侧边栏：配置 ---
 with st.sidebar:
     st.header("⚙️ 配置面板")
@@ -309,13 +575,25 @@ with st.sidebar:
         idd_path = os.path.join(temp_dir, uploaded_idd.name)
         idf_path = os.path.join(temp_dir, uploaded_idf.name)
         
-        with open(idd_path, "wb") as f: f.write(uploaded_idd.getbuffer())
-        with open(idf_path, "wb") as f: f.write(uploaded_idf.getbuffer())
+        # 仅当上传内容变化（或临时文件不存在）时才写盘，避免每次 rerun 重写整个文件
+        for hash_key, uploaded, path in (("idd_hash", uploaded_idd, idd_path), ("idf_hash", uploaded_idf, idf_path)):
+            content_hash = hashlib.sha256(uploaded.getbuffer()).hexdigest()
+            if st.session_state.get(hash_key) != content_hash or not os.path.exists(path):
+                with open(path, "wb") as f: f.write(uploaded.getbuffer())
+                st.session_state[hash_key] = content_hash
         
         if st.button("🚀 初始化系统"):
             with st.spinner("正在加载 EnergyPlus 模型..."):
                 try:
-                    auto = EnergyPlusAutomationUI(idf_path, idd_path, api_key)
+                    idd_hash, idf_hash = st.session_state.idd_hash, st.session_state.idf_hash
+                    base_idf = _load_idf_cached(idd_path, idf_path, idd_hash, idf_hash)
+                    auto = EnergyPlusAutomationUI(
+                        idf_path, idd_path, api_key,
+                        idf_text=_decode_idf_text(uploaded_idf.getbuffer()),
+                        base_idf=base_idf
+                    )
+                    # 记录本次实际加载的文件哈希；侧边栏的哈希会随上传内容变化，不能直接作缓存键
+                    auto.idd_hash, auto.idf_hash = idd_hash, idf_hash
                     st.session_state.automation = auto
                     st.session_state.step = 2
                     st.success("模型加载成功！")
@@ -376,30 +654,31 @@ elif st.session_state.step == 2:
     # 分类详情展示（全宽）
     st.divider()
     with st.expander("🔍 查看详细 Object 分类", expanded=False):
-        # 按数量排序
-        sorted_summary = sorted(summary.items(), key=lambda x: x[1]['count'], reverse=True)
+        # 按数量排序（结果按已加载文件的哈希缓存）
+        auto = st.session_state.automation
+        sorted_summary = _build_sorted_summary(auto.idf_hash, auto.idd_hash, auto)
         
-        for obj_type, info in sorted_summary:
-            with st.expander(f"{obj_type} ({info['count']} 个)", expanded=False):
+        for obj_type, count in sorted_summary:
+            with st.expander(f"{obj_type} ({count} 个)", expanded=False):
                 col1, col2 = st.columns([2, 1])
                 with col1:
-                    st.write("**所有 Names:**")
-                    # 显示所有名称
-                    names_list = info.get('all_names', [])
-                    # 分三列显示
-                    cols = st.columns(3)
-                    for idx, name in enumerate(names_list):
-                        with cols[idx % 3]:
-                            st.write(f"  • {name}")
+                    # 折叠的 expander 内容每次 rerun 同样会执行，
+                    # 因此 Names 只在打开开关后才构建与渲染
+                    if st.toggle("**显示所有 Names**", key=f"show_names_{obj_type}"):
+                        name_columns = _build_name_columns(auto.idf_hash, auto.idd_hash, obj_type, auto)
+                        # 分三列显示（每列一次渲染）
+                        cols = st.columns(3)
+                        for col, column_text in zip(cols, name_columns):
+                            with col:
+                                st.markdown(column_text)
                 with col2:
-                    st.write(f"**数量:** {info['count']}")
+                    st.write(f"**数量:** {count}")
                 
                 # 显示字段信息
                 if obj_type in st.session_state.automation.base_idf.idfobjects:
                     objs = st.session_state.automation.base_idf.idfobjects[obj_type]
                     if len(objs) > 0:
-                        first_obj = objs[0]
-                        actual_fields = st.session_state.automation._get_active_fields(first_obj)
+                        actual_fields = st.session_state.automation.get_all_fields(obj_type)
 
                         with st.expander(f"查看字段列表 ({len(actual_fields)} 个字段)"):
                             st.info("ℹ️ 仅展示当前 IDF 中实际写入的字段（不含尾部空字段）。")
@@ -446,21 +725,21 @@ elif st.session_state.step == 4:
     # 临时存储用户的选择
     current_config = {}
     
+    # 尝试获取 LLM 推荐：所有尚未分析的对象类型并发请求
+    if 'ai_field_suggestions' not in st.session_state: st.session_state.ai_field_suggestions = {}
+    pending = [ot for ot in st.session_state.selected_objects if ot not in st.session_state.ai_field_suggestions]
+    if pending:
+        with st.spinner(f"正在分析 {', '.join(pending)} 的字段..."):
+            # 存储建议以防刷新丢失
+            st.session_state.ai_field_suggestions.update(
+                st.session_state.automation.generate_field_plans(st.session_state.user_request, pending)
+            )
+    
     for obj_type in st.session_state.selected_objects:
         st.markdown(f"#### 对象: `{obj_type}`")
         
         col1, col2 = st.columns([3, 1])
         with col1:
-            # 尝试获取 LLM 推荐
-            if obj_type not in st.session_state.get('ai_field_suggestions', {}):
-                 with st.spinner(f"正在分析 {obj_type} 的字段..."):
-                     field_plan = st.session_state.automation.generate_field_plan(
-                         st.session_state.user_request, obj_type
-                     )
-                     # 存储建议以防刷新丢失
-                     if 'ai_field_suggestions' not in st.session_state: st.session_state.ai_field_suggestions = {}
-                     st.session_state.ai_field_suggestions[obj_type] = field_plan
-
             # 解析推荐
             suggestion = st.session_state.ai_field_suggestions.get(obj_type)
             suggested_fields = []
@@ -532,31 +811,34 @@ elif st.session_state.step == 5:
         progress_bar = st.progress(0)
         status_text = st.empty()
         
-        results = [] # 临时列表
+        # 准备数据结构（与系数无关，只需构建一次）
+        mods = []
+        for obj, fields in st.session_state.field_config.items():
+            mods.append({
+                'object_type': obj,
+                'fields': fields
+            })
+        # 文本只解析一次，各系数复用同一份替换计划
+        auto = st.session_state.automation
+        plan = auto._prepare_replacement_plan(auto._collect_targets(mods))
         
+        results = []
+        # 各系数依次写出，共用同一份替换计划。
+        # 不使用进程池：fork 在 Streamlit 多线程服务进程中不安全；spawn 子进程会把 UI.py 当作 __mp_main__ 重新执行整个页面脚本
         for idx, coef in enumerate(coefficients):
-            status_text.text(f"正在生成 Case {idx+1}/{len(coefficients)} (系数: {coef})...")
-            
-            # 准备数据结构
-            mods = []
-            for obj, fields in st.session_state.field_config.items():
-                mods.append({
-                    'object_type': obj,
-                    'fields': fields,
-                    'coef': coef
-                })
-            
             file_name = f"{output_prefix}_{coef}.idf"
             file_path = os.path.join(output_dir, file_name)
+            status_text.text(f"正在生成 Case {idx+1}/{len(coefficients)} (系数: {coef})...")
             
             # 调用后台执行修改
-            count = st.session_state.automation.execute_modification(mods, file_path, coefficients)
+            count = auto.execute_modification(mods, file_path, coef, plan)
             results.append((file_name, file_path, count))
             
             progress_bar.progress((idx + 1) / len(coefficients))
         
         status_text.text("✅ 生成完成！")
         st.session_state.generated_results = results
+        st.session_state.zip_bytes = None
         st.session_state.show_done = True
         st.rerun()
 
@@ -565,17 +847,21 @@ elif st.session_state.step == 5:
         st.divider()
         st.success("🎉 生成任务已完成")
         
-        # 1. 创建 ZIP 打包逻辑
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w") as zf:
-            for fname, fpath, _ in st.session_state.generated_results:
-                # 将文件写入内存中的 ZIP
-                zf.write(fpath, arcname=fname)
+        # 1. 创建 ZIP 打包逻辑（每批结果只打包一次，rerun 时直接复用）
+        if st.session_state.get('zip_bytes') is None:
+            zip_buffer = io.BytesIO()
+            # IDF 是高度可压缩的文本，最低压缩级别即可大幅缩小体积且速度最快
+            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+                for fname, fpath, _ in st.session_state.generated_results:
+                    # 将文件写入内存中的 ZIP
+                    zf.write(fpath, arcname=fname)
+            # 只保留一份 bytes，缓冲区随即释放
+            st.session_state.zip_bytes = zip_buffer.getvalue()
         
         # 2. 显示一键下载 ZIP 按钮
         st.download_button(
             label="📦 一键打包下载所有文件 (.zip)",
-            data=zip_buffer.getvalue(),
+            data=st.session_state.zip_bytes,
             file_name=f"{output_prefix}_All_Cases.zip",
             mime="application/zip",
             type="primary"
@@ -590,6 +876,7 @@ elif st.session_state.step == 5:
     if st.button("🔙 返回修改配置"):
         # 清除结果状态以便重新生成
         st.session_state.generated_results = None
+        st.session_state.zip_bytes = None
         st.session_state.step = 4
         st.rerun()
 